@@ -1,13 +1,24 @@
 
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, literal
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 import models, schemas
 
+# Versions are assigned at insert, not commit, so a lower version can become
+# visible after a higher one. A gap in the feed holds the watermark until it
+# fills or the row after it is older than this (e.g. a rolled-back insert).
+CHANGE_GAP_TIMEOUT = timedelta(seconds=30)
+# Changelog rows older than this are pruned by the cleanup job
+CHANGELOG_RETENTION = timedelta(days=int(os.getenv("CHANGELOG_RETENTION_DAYS", "30")))
+
 def create_tree(db: Session, tree: schemas.TreeCreate):
     try:
         db_tree = models.Tree(**tree.dict())
         db.add(db_tree)
+        record_change(db, "tree", db_tree.TreeID, "insert")
         db.commit()
         db.refresh(db_tree)
         return db_tree
@@ -19,6 +30,7 @@ def create_seed(db: Session, seed: schemas.SeedCreate):
     try:
         db_seed = models.Seed(**seed.dict())
         db.add(db_seed)
+        record_change(db, "seed", db_seed.SeedID, "insert")
         db.commit()
         db.refresh(db_seed)
         return db_seed
@@ -36,3 +48,147 @@ def log_sync(db: Session, sync: schemas.SyncLogCreate):
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=400, detail="Sync failed. TreeID may not exist or duplicate SyncID.")
+
+# Change feed: rows are added to the caller's transaction so the change and
+# the data it describes are committed together.
+def record_change(db: Session, entity_type: str, entity_id: str, operation: str):
+    db.add(models.ChangeLog(EntityType=entity_type, EntityID=entity_id, Operation=operation))
+
+def get_changes(db: Session, entity_type: str, since: int = 0, limit: int = 5000):
+    # Versions are shared by all entity types, so gaps are checked across all rows
+    rows = (
+        db.query(models.ChangeLog)
+        .filter(models.ChangeLog.Version > since)
+        .order_by(models.ChangeLog.Version)
+        .limit(limit)
+        .all()
+    )
+
+    version = since
+    cutoff = datetime.utcnow() - CHANGE_GAP_TIMEOUT
+    for row in rows:
+        if row.Version != version + 1 and row.Timestamp > cutoff:
+            break
+        version = row.Version
+
+    # Collapse to the net operation per ID; an update after an insert in the
+    # same window is still an insert for the client. Changes past the
+    # watermark are included too and will be sent again on the next poll.
+    ops = {}
+    for row in rows:
+        if row.EntityType != entity_type:
+            continue
+        if row.Operation == "update" and ops.get(row.EntityID) == "insert":
+            continue
+        ops[row.EntityID] = row.Operation
+
+    return {
+        "version": version,
+        "inserted": [i for i, op in ops.items() if op == "insert"],
+        "updated": [i for i, op in ops.items() if op == "update"],
+        "deleted": [i for i, op in ops.items() if op == "delete"],
+    }
+
+# Soft delete: rows are tombstoned with DeletedAt (so the Kobo sync won't
+# re-import them) by set-based UPDATEs; deleting trees cascades to their seeds.
+# The shared DeletedAt value identifies this batch for the cascade and the
+# changelog INSERT ... SELECT.
+def _log_deletes(db: Session, model, id_column, entity_type, now):
+    db.execute(insert(models.ChangeLog).from_select(
+        ["EntityType", "EntityID", "Operation", "Timestamp"],
+        select(literal(entity_type), id_column, literal("delete"), literal(now)).where(model.DeletedAt == now),
+    ))
+
+def delete_records(db: Session, model, ids=None, filters=None):
+    if not ids and not filters:
+        raise HTTPException(status_code=400, detail="Provide ids or filters to delete.")
+
+    is_tree = model is models.Tree
+    id_column = model.TreeID if is_tree else model.SeedID
+    columns = model.__table__.columns
+
+    conditions = []
+    if ids:
+        conditions.append(id_column.in_(ids))
+    for column, value in (filters or {}).items():
+        if column not in columns or column == "DeletedAt":
+            raise HTTPException(status_code=400, detail=f"Unknown filter column: {column}")
+        conditions.append(columns[column] == value)
+
+    now = datetime.utcnow()
+    deleted = db.execute(
+        update(model)
+        .where(model.DeletedAt.is_(None), *conditions)
+        .values(DeletedAt=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    _log_deletes(db, model, id_column, "tree" if is_tree else "seed", now)
+
+    cascaded = 0
+    if is_tree and deleted:
+        cascaded = db.execute(
+            update(models.Seed)
+            .where(
+                models.Seed.DeletedAt.is_(None),
+                models.Seed.ParentTreeID.in_(select(models.Tree.TreeID).where(models.Tree.DeletedAt == now)),
+            )
+            .values(DeletedAt=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        _log_deletes(db, models.Seed, models.Seed.SeedID, "seed", now)
+
+    db.commit()
+    return {"deleted": deleted, "cascaded_seeds": cascaded}
+
+# Cleanup: remove QR PNGs of deleted trees and seeds, SyncLog rows that no
+# longer belong to a live record, and changelog rows past retention. Only
+# tombstoned IDs' QR files are removed, since the sync writes a QR file before
+# committing its row. Error logs are kept since they explain why a record is
+# missing.
+def purge_orphans(db: Session, qr_dir: str = "static/qrcodes", batch_size: int = 500):
+    deleted_ids = set(db.scalars(select(models.Tree.TreeID).where(models.Tree.DeletedAt.isnot(None))))
+    deleted_ids.update(db.scalars(select(models.Seed.SeedID).where(models.Seed.DeletedAt.isnot(None))))
+
+    removed_files = 0
+    if os.path.isdir(qr_dir):
+        for entry in os.scandir(qr_dir):
+            name, ext = os.path.splitext(entry.name)
+            if entry.is_file() and ext == ".png" and name in deleted_ids:
+                os.remove(entry.path)
+                removed_files += 1
+
+    live_tree = select(models.Tree.TreeID).where(
+        models.Tree.TreeID == models.SyncLog.TreeID, models.Tree.DeletedAt.is_(None)
+    ).exists()
+    live_seed = select(models.Seed.SeedID).where(
+        models.Seed.SeedID == models.SyncLog.TreeID, models.Seed.DeletedAt.is_(None)
+    ).exists()
+
+    removed_logs = 0
+    while True:
+        batch = list(db.scalars(
+            select(models.SyncLog.SyncID)
+            .where(~live_tree, ~live_seed, ~models.SyncLog.Status.like("Error%"))
+            .limit(batch_size)
+        ))
+        if not batch:
+            break
+        db.execute(delete(models.SyncLog).where(models.SyncLog.SyncID.in_(batch)))
+        db.commit()
+        removed_logs += len(batch)
+
+    changelog_cutoff = datetime.utcnow() - CHANGELOG_RETENTION
+    removed_changes = 0
+    while True:
+        batch = list(db.scalars(
+            select(models.ChangeLog.Version)
+            .where(models.ChangeLog.Timestamp < changelog_cutoff)
+            .limit(batch_size)
+        ))
+        if not batch:
+            break
+        db.execute(delete(models.ChangeLog).where(models.ChangeLog.Version.in_(batch)))
+        db.commit()
+        removed_changes += len(batch)
+
+    return {"qr_files": removed_files, "sync_logs": removed_logs, "changelog": removed_changes}
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Ghana bounding box (lat min, lat max, lon min, lon max), with a small margin
+GHANA_BOUNDS = (4.5, 11.5, -3.5, 1.5)
+
+# Robust z-score (median absolute deviation) above which a point is an outlier
+OUTLIER_THRESHOLD = 6.0
+# Smallest spread (degrees, ~2 km) used for the z-score, so a tightly sampled
+# reserve doesn't flag its own edges
+OUTLIER_MIN_SCALE = 0.02
+# GPS_LOCATION altitude/accuracy are used when its lat/lon agree with the chosen point to this many degrees
+SOURCE_MATCH_TOLERANCE = 1e-5
+# Points equal to this many decimals (~1 m) are treated as the same location
+DUPLICATE_DECIMALS = 5
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _to_float(values):
+    """Convert an array of strings/numbers to floats, NaN where not numeric."""
+    values = np.where(values == "", "nan", values) if values.dtype.kind == "U" else values
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        # Only pages with malformed values take the element-wise path
+        return np.array([_parse_float(v) for v in values.ravel()], dtype=float).reshape(values.shape)
+
+def _split_fields(strings, count=4):
+    """Split space-separated GPS strings ("lat lon alt acc") into a (n, count) array."""
+    fields = []
+    rest = np.strings.strip(strings)
+    for _ in range(count):
+        head, _, rest = np.strings.partition(rest, " ")
+        rest = np.strings.lstrip(rest)
+        fields.append(head)
+    return np.stack(fields, axis=1)
+
+def normalise_gps(records):
+    """Parse and validate the coordinates of a whole page of Kobo records.
+
+    `_geolocation` ([lat, lon]) is preferred, falling back to the
+    `GPS_LOCATION` string; altitude and accuracy come from `GPS_LOCATION`
+    whenever its lat/lon match the chosen point. Outliers are judged within
+    each forest reserve (or district). Returns a dict of arrays aligned with
+    `records`: latitude, longitude, altitude, accuracy (NaN where unknown or
+    rejected), `gps_text` (the source "lat,lon" text, kept even for rejected
+    points so they can be corrected), `rejected` (reason, "" if kept) and
+    `flags` (comma-separated outlier/duplicate warnings for kept points).
+    """
+    n = len(records)
+    geolocation = [record.get("_geolocation") for record in records]
+    geolocation = [g if isinstance(g, (list, tuple)) and len(g) == 2 else (None, None) for g in geolocation]
+    geo = _to_float(np.array(geolocation, dtype=object).reshape(n, 2))
+    strings = np.array([str(record.get("GPS_LOCATION") or "") for record in records], dtype=str)
+    field_text = _split_fields(strings) if n else np.empty((0, 4), dtype=str)
+    fields = _to_float(field_text)
+
+    # An empty (0, 0) fix is treated as missing, so GPS_LOCATION is used instead
+    use_geo = np.all(np.isfinite(geo), axis=1) & ~np.all(geo == 0, axis=1)
+    lat = np.where(use_geo, geo[:, 0], fields[:, 0])
+    lon = np.where(use_geo, geo[:, 1], fields[:, 1])
+    geo_text = np.strings.add(np.strings.add(geo[:, 0].astype(str), ","), geo[:, 1].astype(str))
+    location_text = np.strings.add(np.strings.add(field_text[:, 0], ","), field_text[:, 1])
+    gps_text = np.strings.strip(np.where(use_geo, geo_text, location_text), ",")
+    # Kobo fills both from the same geopoint; only trust altitude/accuracy
+    # when GPS_LOCATION describes the same point
+    with np.errstate(invalid="ignore"):
+        same_point = (np.abs(fields[:, 0] - lat) <= SOURCE_MATCH_TOLERANCE) & (
+            np.abs(fields[:, 1] - lon) <= SOURCE_MATCH_TOLERANCE
+        )
+    alt = np.where(same_point, fields[:, 2], np.nan)
+    acc = np.where(same_point, fields[:, 3], np.nan)
+
+    lat_min, lat_max, lon_min, lon_max = GHANA_BOUNDS
+    missing = ~(np.isfinite(lat) & np.isfinite(lon))
+    with np.errstate(invalid="ignore"):
+        out_of_range = ~missing & ((np.abs(lat) > 90) | (np.abs(lon) > 180))
+        outside_ghana = ~missing & ~out_of_range & (
+            (lat < lat_min) | (lat > lat_max) | (lon < lon_min) | (lon > lon_max)
+        )
+
+    rejected = np.full(n, "", dtype=object)
+    rejected[missing] = "missing"
+    rejected[out_of_range] = "out_of_range"
+    rejected[outside_ghana] = "outside_ghana"
+    valid = rejected == ""
+
+    flags = np.full(n, "", dtype=object)
+    valid_index = np.flatnonzero(valid)
+    points = np.column_stack([lat[valid], lon[valid]])
+    groups = np.array([
+        str(record.get("FOREST_RESERVE_NAME") or record.get("DISTRICT_NAME") or "").strip().lower()
+        for record in records
+    ], dtype=object)[valid]
+    for group in np.unique(groups) if len(points) else ():
+        in_group = groups == group
+        if in_group.sum() < 3:
+            continue
+        group_points = points[in_group]
+        median = np.median(group_points, axis=0)
+        scale = np.maximum(1.4826 * np.median(np.abs(group_points - median), axis=0), OUTLIER_MIN_SCALE)
+        outlier = np.any(np.abs(group_points - median) / scale > OUTLIER_THRESHOLD, axis=1)
+        flags[valid_index[in_group][outlier]] = "outlier"
+    if len(points) >= 2:
+        _, inverse, counts = np.unique(
+            np.round(points, DUPLICATE_DECIMALS), axis=0, return_inverse=True, return_counts=True
+        )
+        duplicate = valid_index[counts[inverse.ravel()] > 1]
+        flags[duplicate] = [f"{flag},duplicate_location" if flag else "duplicate_location" for flag in flags[duplicate]]
+
+    lat, lon, alt, acc = (np.where(valid, values, np.nan) for values in (lat, lon, alt, acc))
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "altitude": alt,
+        "accuracy": acc,
+        "gps_text": gps_text,
+        "rejected": rejected,
+        "flags": flags,
+    }
+
+def gps_columns(page, index):
+    """Column values for one record of a normalised page (NaN becomes None)."""
+    values = {
+        "Latitude": page["latitude"][index],
+        "Longitude": page["longitude"][index],
+        "Altitude": page["altitude"][index],
+        "GPSAccuracy": page["accuracy"][index],
+    }
+    values = {k: (float(v) if np.isfinite(v) else None) for k, v in values.items()}
+    values["GPS"] = str(page["gps_text"][index])
+    return values
@@ -1,14 +1,19 @@
 import os
+import json
+import time
+import threading
 import requests
 import qrcode
 import logging
 from dotenv import load_dotenv
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
-from models import Tree, Seed, SyncLog, KoboRawResponse
+from models import Tree, Seed, SyncLog, KoboRawResponse, ChangeLog
+from geo import normalise_gps, gps_columns
 from sqlalchemy.exc import IntegrityError
 from database import Base
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Setup logging
 logging.basicConfig(filename="sync_log.txt", level=logging.INFO, format="%(asctime)s - %(message)s")
@@ -19,6 +24,8 @@ load_dotenv()
 KOBO_TOKEN = os.getenv("KOBO_TOKEN")
 TREE_FORM_ID = os.getenv("TREE_FORM_ID")
 SEED_FORM_ID = os.getenv("SEED_FORM_ID")
+KOBO_FORMS_FILE = os.getenv("KOBO_FORMS_FILE", "forms.json")
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
@@ -31,6 +38,56 @@ SessionLocal = sessionmaker(bind=engine)
 
 region_map = {"juaso": "JUA", "mampong": "MAM", "kumawu": "KUM"}
 reserve_map = {"bobiri": "BOB", "dome": "DOM", "ofhe": "OFH"}
+model_map = {"tree": Tree, "seed": Seed}
+
+KOBO_API_URL = "https://kf.kobotoolbox.org/api/v2/assets"
+
+def load_form_registry(path=KOBO_FORMS_FILE):
+    """Build the form registry (form ID -> target model + mapping config).
+
+    Reads a JSON list of forms from `path`; falls back to TREE_FORM_ID and
+    SEED_FORM_ID when the file does not exist.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    else:
+        entries = [
+            {"form_id": TREE_FORM_ID, "model": "tree"},
+            {"form_id": SEED_FORM_ID, "model": "seed"},
+        ]
+
+    registry = {}
+    for entry in entries:
+        form_id = entry.get("form_id")
+        if not form_id:
+            continue
+        model = model_map.get(str(entry.get("model", "tree")).lower())
+        if model is None:
+            raise ValueError(f"Unknown model {entry.get('model')!r} for form {form_id}")
+        registry[form_id] = {
+            "model": model,
+            "field_map": entry.get("field_map", {}),
+            "rate_limit": float(entry.get("rate_limit", 1.0)),
+            "page_size": int(entry.get("page_size", 1000)),
+        }
+    return registry
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
 
 def generate_species_code(name):
     if not name:
@@ -50,116 +107,195 @@ def filter_fields(record, model):
     valid_keys = set(c.name for c in model.__table__.columns)
     return {k: v for k, v in record.items() if k in valid_keys}
 
-# ✅ Updated clean_gps function
-def clean_gps(record):
-    geo = record.get("_geolocation")
-    if geo and isinstance(geo, list) and len(geo) == 2 and all(geo):
-        cleaned = f"{geo[0]},{geo[1]}"
-        print(f"✅ Cleaned GPS from _geolocation for record {record.get('_id')}: {cleaned}")
-        return cleaned
-
-    raw_gps = record.get("GPS_LOCATION")
-    if raw_gps:
-        parts = raw_gps.split()
-        if len(parts) >= 2:
-            cleaned = f"{parts[0]},{parts[1]}"
-            print(f"✅ Cleaned GPS from GPS_LOCATION for record {record.get('_id')}: {cleaned}")
-            return cleaned
-
-    print(f"❌ Missing GPS for record {record.get('_id')}")
-    return ""
-
-def sync_kobo(form_id, model, is_tree=True):
-    print(f"🔄 Starting sync for {'Tree' if is_tree else 'Seed'} form...")
-    url = f"https://kf.kobotoolbox.org/api/v2/assets/{form_id}/data/?format=json"
+def save_raw_response(session, form_id, raw_response, page_number):
+    # Save raw response to file (one file per form so concurrent syncs don't clobber each other)
+    with open(f"kobo_raw_response_{form_id}.txt", "w" if page_number == 0 else "a", encoding="utf-8") as f:
+        f.write(raw_response)
+
+    # Save raw response to database
+    raw_entry = KoboRawResponse(response_json=raw_response)
+    session.add(raw_entry)
+    session.commit()
+    print(f"📝 Raw Kobo response saved to database with ID {raw_entry.id}")
+
+def fetch_kobo_pages(session, form_id, limiter=None, page_size=1000):
+    """Yield the results of each page of a Kobo form's submissions.
+
+    Every raw response is saved before its status is checked, so error
+    responses are kept for debugging.
+    """
+    url = f"{KOBO_API_URL}/{form_id}/data/?format=json&limit={page_size}"
     headers = {"Authorization": f"Token {KOBO_TOKEN}"}
+    page_number = 0
+    while url:
+        if limiter:
+            limiter.wait()
+        response = requests.get(url, headers=headers)
+        save_raw_response(session, form_id, response.text, page_number)
+        response.raise_for_status()
+        payload = response.json()
+        yield payload.get("results", [])
+        url = payload.get("next")
+        page_number += 1
+
+def sync_kobo(form_id, model, field_map=None, limiter=None, page_size=1000):
+    is_tree = model is Tree
+    field_map = field_map or {}
+    stats = {"form_id": form_id, "model": model.__name__, "fetched": 0, "inserted": 0,
+             "duplicates": 0, "skipped": 0, "errors": 0, "gps_rejected": 0, "gps_flagged": 0,
+             "status": "Success"}
+    started = time.monotonic()
+
+    print(f"🔄 Starting sync for {'Tree' if is_tree else 'Seed'} form {form_id}...")
     session = SessionLocal()
 
     try:
-        response = requests.get(url, headers=headers)
-        raw_response = response.text
+        # Soft-deleted records stay deleted: skip their Kobo submissions
+        deleted_kobo_ids = {
+            kobo_id for (kobo_id,) in session.query(model.KoboID).filter(model.DeletedAt.isnot(None))
+        }
 
-        # Save raw response to file
-        with open("kobo_raw_response.txt", "w", encoding="utf-8") as f:
-            f.write(raw_response)
+        for data in fetch_kobo_pages(session, form_id, limiter, page_size):
+            stats["fetched"] += len(data)
+            print(f"✅ Fetched {len(data)} records from Kobo form {form_id}")
 
-        # Save raw response to database
-        raw_entry = KoboRawResponse(response_json=raw_response)
-        session.add(raw_entry)
-        session.commit()
-        print(f"📝 Raw Kobo response saved to database with ID {raw_entry.id}")
+            if field_map:
+                data = [{field_map.get(k, k): v for k, v in record.items()} for record in data]
 
-        response.raise_for_status()
-        data = response.json().get("results", [])
-        print(f"✅ Fetched {len(data)} records from Kobo")
+            # Parse and validate the whole page's coordinates in one pass
+            if is_tree:
+                gps_page = normalise_gps(data)
 
-        for record in data:
-            try:
-                kobo_id = record.get("_id")
-                if not kobo_id:
-                    continue
-
-                region = region_map.get(record.get("DISTRICT_NAME", "").lower(), "UNK")
-                reserve = reserve_map.get(record.get("FOREST_RESERVE_NAME", "").lower(), "UNK")
-                species = record.get("SPECIES_NAME") or record.get("SPECIES")
-                species_code = generate_species_code(species)
-                unique_id = f"TREE-{kobo_id}" if is_tree else f"SEED-{kobo_id}"
-                qr_url = generate_qr(unique_id)
-
-                print(f"📦 Processing record {unique_id}")
-                logging.info(f"Processing record {unique_id}")
-
-                filtered = filter_fields(record, Tree if is_tree else Seed)
-
-                if is_tree:
-                    filtered["GPS"] = clean_gps(record)
-                    tree = Tree(
-                        **filtered,
-                        TreeID=unique_id,
-                        KoboID=kobo_id,
-                        RegionCode=region,
-                        ReserveCode=reserve,
-                        SpeciesCode=species_code,
-                        QRCodeURL=qr_url
-                    )
-                    session.add(tree)
-                else:
-                    seed = Seed(
-                        **filtered,
-                        SeedID=unique_id,
-                        KoboID=kobo_id,
-                        SpeciesCode=species_code,
-                        QRCodeURL=qr_url
-                    )
-                    session.add(seed)
-
-                session.commit()
-
-                sync_log = SyncLog(TreeID=unique_id, Status="Success", Timestamp=datetime.utcnow())
-                session.add(sync_log)
-                session.commit()
-
-            except IntegrityError:
-                session.rollback()
-                sync_log = SyncLog(TreeID=unique_id, Status="Duplicate", Timestamp=datetime.utcnow())
-                session.add(sync_log)
-                session.commit()
-                print(f"⚠️ Duplicate record {unique_id}")
-                logging.warning(f"Duplicate record {unique_id}")
-            except Exception as e:
-                session.rollback()
-                sync_log = SyncLog(TreeID=unique_id, Status=f"Error: {str(e)}", Timestamp=datetime.utcnow())
-                session.add(sync_log)
-                session.commit()
-                print(f"❌ Error syncing {unique_id}: {str(e)}")
-                logging.error(f"Error syncing {unique_id}: {str(e)}")
+            for index, record in enumerate(data):
+                try:
+                    kobo_id = record.get("_id")
+                    if not kobo_id:
+                        continue
+                    if kobo_id in deleted_kobo_ids:
+                        stats["skipped"] += 1
+                        logging.info(f"Skipping deleted Kobo record {kobo_id}")
+                        continue
+
+                    region = region_map.get(record.get("DISTRICT_NAME", "").lower(), "UNK")
+                    reserve = reserve_map.get(record.get("FOREST_RESERVE_NAME", "").lower(), "UNK")
+                    species = record.get("SPECIES_NAME") or record.get("SPECIES")
+                    species_code = generate_species_code(species)
+                    unique_id = f"TREE-{kobo_id}" if is_tree else f"SEED-{kobo_id}"
+                    qr_url = generate_qr(unique_id)
+
+                    print(f"📦 Processing record {unique_id}")
+                    logging.info(f"Processing record {unique_id}")
+
+                    filtered = filter_fields(record, model)
+
+                    status = "Success"
+                    if is_tree:
+                        filtered.update(gps_columns(gps_page, index))
+                        if gps_page["rejected"][index]:
+                            status = f"Success (GPS rejected: {gps_page['rejected'][index]})"
+                        elif gps_page["flags"][index]:
+                            status = f"Success (GPS flagged: {gps_page['flags'][index]})"
+                        tree = model(
+                            **filtered,
+                            TreeID=unique_id,
+                            KoboID=kobo_id,
+                            RegionCode=region,
+                            ReserveCode=reserve,
+                            SpeciesCode=species_code,
+                            QRCodeURL=qr_url
+                        )
+                        session.add(tree)
+                    else:
+                        seed = model(
+                            **filtered,
+                            SeedID=unique_id,
+                            KoboID=kobo_id,
+                            SpeciesCode=species_code,
+                            QRCodeURL=qr_url
+                        )
+                        session.add(seed)
+
+                    session.add(ChangeLog(EntityType="tree" if is_tree else "seed", EntityID=unique_id, Operation="insert"))
+                    session.commit()
+                    stats["inserted"] += 1
+                    if is_tree and gps_page["rejected"][index]:
+                        stats["gps_rejected"] += 1
+                        logging.warning(f"GPS rejected for {unique_id}: {gps_page['rejected'][index]}")
+                    elif is_tree and gps_page["flags"][index]:
+                        stats["gps_flagged"] += 1
+
+                    sync_log = SyncLog(TreeID=unique_id, Status=status, Timestamp=datetime.utcnow())
+                    session.add(sync_log)
+                    session.commit()
+
+                except IntegrityError:
+                    session.rollback()
+                    stats["duplicates"] += 1
+                    sync_log = SyncLog(TreeID=unique_id, Status="Duplicate", Timestamp=datetime.utcnow())
+                    session.add(sync_log)
+                    session.commit()
+                    print(f"⚠️ Duplicate record {unique_id}")
+                    logging.warning(f"Duplicate record {unique_id}")
+                except Exception as e:
+                    session.rollback()
+                    stats["errors"] += 1
+                    sync_log = SyncLog(TreeID=unique_id, Status=f"Error: {str(e)}", Timestamp=datetime.utcnow())
+                    session.add(sync_log)
+                    session.commit()
+                    print(f"❌ Error syncing {unique_id}: {str(e)}")
+                    logging.error(f"Error syncing {unique_id}: {str(e)}")
 
     except Exception as e:
-        print(f"❌ Sync failed: {str(e)}")
-        logging.critical(f"Sync failed: {str(e)}")
+        stats["status"] = f"Failed: {str(e)}"
+        print(f"❌ Sync failed for form {form_id}: {str(e)}")
+        logging.critical(f"Sync failed for form {form_id}: {str(e)}")
     finally:
         session.close()
 
-# Run both syncs
-sync_kobo(TREE_FORM_ID, Tree, is_tree=True)
-sync_kobo(SEED_FORM_ID, Seed, is_tree=False)
+    stats["elapsed"] = round(time.monotonic() - started, 2)
+    return stats
+
+def sync_all_forms(registry=None, max_workers=SYNC_WORKERS):
+    """Sync every registered form concurrently; one form failing doesn't stop the others."""
+    registry = registry if registry is not None else load_form_registry()
+    started = time.monotonic()
+    results = []
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {
+            pool.submit(
+                sync_kobo,
+                form_id,
+                config["model"],
+                field_map=config["field_map"],
+                limiter=RateLimiter(config["rate_limit"]),
+                page_size=config["page_size"],
+            ): form_id
+            for form_id, config in registry.items()
+        }
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"form_id": futures[future], "status": f"Failed: {str(e)}"})
+
+    elapsed = time.monotonic() - started
+    fetched = sum(r.get("fetched", 0) for r in results)
+    summary = {
+        "forms": len(results),
+        "failed": sum(1 for r in results if r["status"] != "Success"),
+        "fetched": fetched,
+        "inserted": sum(r.get("inserted", 0) for r in results),
+        "gps_rejected": sum(r.get("gps_rejected", 0) for r in results),
+        "elapsed": round(elapsed, 2),
+        "records_per_second": round(fetched / elapsed, 2) if elapsed > 0 else 0.0,
+        "results": results,
+    }
+    print(f"🏁 Synced {summary['forms']} forms ({summary['failed']} failed): "
+          f"{fetched} records in {summary['elapsed']}s ({summary['records_per_second']} rec/s)")
+    logging.info(f"Sync summary: {json.dumps({k: v for k, v in summary.items() if k != 'results'})}")
+    return summary
+
+# Run all registered form syncs
+if __name__ == "__main__":
+    sync_all_forms()
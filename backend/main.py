@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks
 from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
@@ -6,7 +6,7 @@ from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine, Base
 import models, schemas, crud
-from kobo_sync_script import sync_kobo, TREE_FORM_ID, SEED_FORM_ID, Tree, Seed
+from kobo_sync_script import sync_all_forms
 
 # Create tables
 Base.metadata.create_all(bind=engine)
@@ -46,7 +46,7 @@ def log_sync(sync: schemas.SyncLogCreate, db: Session = Depends(get_db)):
 # GET: Scan Tree (HTML page with details + photos)
 @app.get("/scan/{tree_id}")
 def scan_tree(tree_id: str, request: Request, db: Session = Depends(get_db)):
-    tree = db.query(models.Tree).filter(models.Tree.TreeID == tree_id).first()
+    tree = db.query(models.Tree).filter(models.Tree.TreeID == tree_id, models.Tree.DeletedAt.is_(None)).first()
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
@@ -68,28 +68,52 @@ def scan_tree(tree_id: str, request: Request, db: Session = Depends(get_db)):
 @app.get("/sync-kobo")
 def sync_kobo_data():
     try:
-        sync_kobo(TREE_FORM_ID, Tree, is_tree=True)
-        sync_kobo(SEED_FORM_ID, Seed, is_tree=False)
-        return {"status": "Sync completed"}
+        summary = sync_all_forms()
+        return {"status": "Sync completed", **summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# DELETE: Tree by TreeID
+# GET: Change feed of inserted/updated/deleted IDs since a version
+@app.get("/changes", response_model=schemas.ChangeFeed)
+def get_changes(entity: str = Query("tree", pattern="^(tree|seed)$"), since: int = 0, limit: int = Query(5000, ge=1, le=50000), db: Session = Depends(get_db)):
+    return crud.get_changes(db, entity, since, limit)
+
+# DELETE: Tree by TreeID (soft delete, cascades to its seeds)
 @app.delete("/trees/{tree_id}")
 def delete_tree(tree_id: str, db: Session = Depends(get_db)):
-    tree = db.query(models.Tree).filter(models.Tree.TreeID == tree_id).first()
-    if not tree:
+    result = crud.delete_records(db, models.Tree, ids=[tree_id])
+    if not result["deleted"]:
         raise HTTPException(status_code=404, detail="Tree not found")
-    db.delete(tree)
-    db.commit()
-    return {"message": f"Tree {tree_id} deleted successfully"}
+    return {"message": f"Tree {tree_id} deleted successfully", **result}
 
-# DELETE: Seed by SeedID
+# DELETE: Seed by SeedID (soft delete)
 @app.delete("/seeds/{seed_id}")
 def delete_seed(seed_id: str, db: Session = Depends(get_db)):
-    seed = db.query(models.Seed).filter(models.Seed.SeedID == seed_id).first()
-    if not seed:
+    result = crud.delete_records(db, models.Seed, ids=[seed_id])
+    if not result["deleted"]:
         raise HTTPException(status_code=404, detail="Seed not found")
-    db.delete(seed)
-    db.commit()
-    return {"message": f"Seed {seed_id} deleted successfully"}
+    return {"message": f"Seed {seed_id} deleted successfully", **result}
+
+# POST: Bulk delete trees by ID list and/or column filters
+@app.post("/trees/bulk-delete")
+def bulk_delete_trees(payload: schemas.BulkDelete, db: Session = Depends(get_db)):
+    return crud.delete_records(db, models.Tree, ids=payload.ids, filters=payload.filters)
+
+# POST: Bulk delete seeds by ID list and/or column filters
+@app.post("/seeds/bulk-delete")
+def bulk_delete_seeds(payload: schemas.BulkDelete, db: Session = Depends(get_db)):
+    return crud.delete_records(db, models.Seed, ids=payload.ids, filters=payload.filters)
+
+# Background job: purge orphaned QR codes and sync log rows
+def run_cleanup():
+    db = SessionLocal()
+    try:
+        crud.purge_orphans(db)
+    finally:
+        db.close()
+
+# POST: Start cleanup in the background
+@app.post("/cleanup")
+def cleanup(background_tasks: BackgroundTasks):
+    background_tasks.add_task(run_cleanup)
+    return {"status": "Cleanup started"}
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, String, Date, Float, Text, Integer, DateTime
+from sqlalchemy.dialects import mysql
 from database import Base
 from datetime import datetime
 
@@ -8,6 +9,10 @@ class Tree(Base):
     KoboID = Column(Integer, unique=True)
     TreeName = Column(String(100))
     GPS = Column(String(100))
+    Latitude = Column(Float)
+    Longitude = Column(Float)
+    Altitude = Column(Float)
+    GPSAccuracy = Column(Float)
     ForestName = Column(String(100))
     TreeType = Column(String(100))
     Species = Column(String(100))
@@ -40,6 +45,7 @@ class Tree(Base):
     ReserveCode = Column(String(100))
     SpeciesCode = Column(String(100))
     QRCodeURL = Column(Text)
+    DeletedAt = Column(DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), index=True)
 
     # Kobo metadata fields
     start = Column(Text)
@@ -64,6 +70,7 @@ class Seed(Base):
     SEED_QUANTITY_COLLECTED = Column(Float)
     SpeciesCode = Column(String(100))
     QRCodeURL = Column(Text)
+    DeletedAt = Column(DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), index=True)
 
 class SyncLog(Base):
     __tablename__ = "synclog"
@@ -77,3 +84,11 @@ class KoboRawResponse(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     response_json = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+class ChangeLog(Base):
+    __tablename__ = "changelog"
+    Version = Column(Integer, primary_key=True, autoincrement=True)
+    EntityType = Column(String(20), index=True)
+    EntityID = Column(String(100))
+    Operation = Column(String(20))
+    Timestamp = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,11 +1,15 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Dict
 from datetime import date
 
 class TreeCreate(BaseModel):
     TreeID: str
     KoboID: Optional[int]
     GPS: Optional[str]
+    Latitude: Optional[float] = None
+    Longitude: Optional[float] = None
+    Altitude: Optional[float] = None
+    GPSAccuracy: Optional[float] = None
     ForestName: Optional[str]
     TreeName: Optional[str]
     TreeType: Optional[str]
@@ -57,3 +61,13 @@ class SeedCreate(BaseModel):
 class SyncLogCreate(BaseModel):
     TreeID: str
     Status: str
+
+class ChangeFeed(BaseModel):
+    version: int
+    inserted: List[str]
+    updated: List[str]
+    deleted: List[str]
+
+class BulkDelete(BaseModel):
+    ids: Optional[List[str]] = None
+    filters: Optional[Dict[str, str]] = None
@@ -0,0 +1,61 @@
+import numpy as np
+
+from geo import normalise_gps, gps_columns
+
+def test_altitude_and_accuracy_kept_when_both_sources_present():
+    records = [{"_geolocation": [6.6, -1.6], "GPS_LOCATION": "6.6 -1.6 230.5 4.8"}]
+    page = normalise_gps(records)
+
+    assert gps_columns(page, 0) == {
+        "Latitude": 6.6,
+        "Longitude": -1.6,
+        "Altitude": 230.5,
+        "GPSAccuracy": 4.8,
+        "GPS": "6.6,-1.6",
+    }
+
+def test_altitude_ignored_when_sources_disagree():
+    records = [{"_geolocation": [6.6, -1.6], "GPS_LOCATION": "6.9 -1.9 100 3"}]
+    page = normalise_gps(records)
+
+    assert page["latitude"][0] == 6.6
+    assert np.isnan(page["altitude"][0]) and np.isnan(page["accuracy"][0])
+
+def test_gps_location_fallback_and_rejections():
+    records = [
+        {"GPS_LOCATION": "6.61 -1.61 230 5"},
+        {"GPS_LOCATION": "abc def"},
+        {"_geolocation": [51.5, 0.1]},
+        {"_geolocation": [95, 0]},
+    ]
+    page = normalise_gps(records)
+
+    assert page["latitude"][0] == 6.61
+    assert list(page["rejected"]) == ["", "missing", "outside_ghana", "out_of_range"]
+
+def test_rejected_point_keeps_source_gps_text():
+    records = [
+        {"GPS_LOCATION": "-1.6 6.6 100 4"},
+        {"_geolocation": [51.5, 0.1]},
+        {"GPS_LOCATION": "abc def"},
+        {},
+    ]
+    page = normalise_gps(records)
+
+    assert list(page["rejected"]) == ["outside_ghana", "outside_ghana", "missing", "missing"]
+    assert gps_columns(page, 0) == {
+        "Latitude": None,
+        "Longitude": None,
+        "Altitude": None,
+        "GPSAccuracy": None,
+        "GPS": "-1.6,6.6",
+    }
+    assert [gps_columns(page, i)["GPS"] for i in range(1, 4)] == ["51.5,0.1", "abc,def", ""]
+
+def test_outliers_judged_per_reserve_and_flags_combined():
+    bobiri = [{"_geolocation": [6.6 + i / 1000, -1.6], "FOREST_RESERVE_NAME": "Bobiri"} for i in range(3)]
+    dome = [{"_geolocation": [7.3 + i / 1000, -1.2], "FOREST_RESERVE_NAME": "Dome"} for i in range(3)]
+    stray = [{"_geolocation": [7.5, -1.0], "FOREST_RESERVE_NAME": "Bobiri"}] * 2
+    page = normalise_gps(bobiri + dome + stray)
+
+    assert list(page["flags"]) == [""] * 6 + ["outlier,duplicate_location"] * 2
@@ -28,7 +28,7 @@ def get_connection():
 # Fetch tree data
 def fetch_tree_data():
     conn = get_connection()
-    query = "SELECT * FROM trees"
+    query = "SELECT * FROM trees WHERE DeletedAt IS NULL"
     df = pd.read_sql(query, conn)
     conn.close()
     return df
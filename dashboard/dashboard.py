@@ -3,7 +3,7 @@ import pandas as pd
 import os
 from dotenv import load_dotenv
 import mysql.connector
-from datetime import datetime
+from datetime import datetime, timedelta
 import folium
 from streamlit_folium import st_folium
 import qrcode
@@ -34,11 +34,102 @@ def get_connection():
 # Fetch tree data
 def fetch_tree_data():
     conn = get_connection()
-    query = "SELECT * FROM trees"
+    query = "SELECT * FROM trees WHERE DeletedAt IS NULL"
     df = pd.read_sql(query, conn)
     conn.close()
     return df
 
+# Versions are assigned at insert, not commit, so a lower version can become
+# visible after a higher one; gaps younger than this hold the watermark back
+CHANGE_GAP_TIMEOUT = timedelta(seconds=30)
+
+# Starting version for a fresh snapshot: just below any change recent enough
+# to still be committing, so the first poll re-reads those
+def fetch_start_version(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT MIN(Version) - 1, (SELECT COALESCE(MAX(Version), 0) FROM changelog) FROM changelog WHERE Timestamp > %s",
+        (datetime.utcnow() - CHANGE_GAP_TIMEOUT,)
+    )
+    recent, latest = cursor.fetchone()
+    cursor.close()
+    return int(recent if recent is not None else latest)
+
+# Changes recorded after a given version (all entity types share the versions)
+def fetch_changes(conn, since):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT Version, EntityType, EntityID, Timestamp FROM changelog WHERE Version > %s ORDER BY Version",
+        (since,)
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+# Highest version with no pending gap below it
+def change_watermark(changes, since):
+    version = since
+    cutoff = datetime.utcnow() - CHANGE_GAP_TIMEOUT
+    for change_version, _, _, timestamp in changes:
+        if change_version != version + 1 and timestamp > cutoff:
+            break
+        version = change_version
+    return version
+
+# Fetch only the given trees, in chunks to keep the IN list bounded
+def fetch_trees_by_id(conn, tree_ids, chunk_size=1000):
+    frames = []
+    for i in range(0, len(tree_ids), chunk_size):
+        chunk = tree_ids[i:i + chunk_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        frames.append(pd.read_sql(f"SELECT * FROM trees WHERE DeletedAt IS NULL AND TreeID IN ({placeholders})", conn, params=chunk))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# Load tree data once per session, then apply change-feed deltas on each rerun
+def load_tree_data():
+    if "tree_df" not in st.session_state:
+        conn = get_connection()
+        try:
+            # Read the version before the snapshot so no change can be missed
+            version = fetch_start_version(conn)
+        finally:
+            conn.close()
+        df = fetch_tree_data()
+    else:
+        df = st.session_state["tree_df"]
+        version = st.session_state["tree_version"]
+        conn = get_connection()
+        try:
+            changes = fetch_changes(conn, version)
+            version = change_watermark(changes, version)
+            # Refetch the current state of every changed tree; deleted ones
+            # don't come back, and changes past the watermark are re-applied
+            # harmlessly on the next poll
+            changed_ids = list({entity_id for _, entity_type, entity_id, _ in changes if entity_type == "tree"})
+            if changed_ids:
+                df = df[~df["TreeID"].isin(changed_ids)]
+                df = pd.concat([df, fetch_trees_by_id(conn, changed_ids)], ignore_index=True)
+        finally:
+            conn.close()
+
+    st.session_state["tree_df"] = df
+    st.session_state["tree_version"] = version
+    return df
+
+# Map coordinates: stored numeric Latitude/Longitude, falling back to the
+# legacy "lat,lon" GPS text for rows synced before those columns existed
+def tree_coordinates(dataframe):
+    coords = pd.DataFrame(index=dataframe.index, columns=["lat", "lon"], dtype=float)
+    if "Latitude" in dataframe.columns and "Longitude" in dataframe.columns:
+        coords["lat"] = pd.to_numeric(dataframe["Latitude"], errors="coerce")
+        coords["lon"] = pd.to_numeric(dataframe["Longitude"], errors="coerce")
+    if "GPS" in dataframe.columns:
+        legacy = dataframe["GPS"].astype(str).str.extract(r"^\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)")
+        missing = coords["lat"].isna() | coords["lon"].isna()
+        coords.loc[missing, "lat"] = pd.to_numeric(legacy[0], errors="coerce")[missing]
+        coords.loc[missing, "lon"] = pd.to_numeric(legacy[1], errors="coerce")[missing]
+    return coords
+
 # Read log file
 def read_log_file(log_path):
     if os.path.exists(log_path):
@@ -99,7 +190,7 @@ st.title("🌳 3T Tree & Seed Tagging Dashboard")
 
 # Load data
 try:
-    df = fetch_tree_data()
+    df = load_tree_data()
     st.success(f"✅ Data loaded: {df.shape[0]} rows, {df.shape[1]} columns")
     if df.empty:
         st.warning("⚠️ No data found in the database. Please check your sync or table.")
@@ -161,19 +252,14 @@ st.text_area("Log Output", log_content, height=300)
 
 # Map display
 st.subheader("🗺 Tree Locations Map")
-map_df = filtered_df.copy()
-map_df = map_df[map_df.get("GPS", "").notnull() & map_df.get("GPS", "").str.contains(",")]
+coords = tree_coordinates(filtered_df)
+map_df = filtered_df.assign(MapLat=coords["lat"], MapLon=coords["lon"]).dropna(subset=["MapLat", "MapLon"])
 if not map_df.empty:
-    lat, lon = map_df.iloc[0].get("GPS", "0,0").split(",")
-    m = folium.Map(location=[float(lat), float(lon)], zoom_start=12)
+    m = folium.Map(location=[map_df["MapLat"].iloc[0], map_df["MapLon"].iloc[0]], zoom_start=12)
     for _, row in map_df.iterrows():
-        try:
-            lat, lon = row.get("GPS", "0,0").split(",")
-            popup = f"{row.get('TreeID', '')} - {row.get('TreeName', '')} ({row.get('SPECIES_NAME', '')})"
-            tooltip = row.get("FOREST_RESERVE_NAME", "")
-            folium.Marker(location=[float(lat), float(lon)], popup=popup, tooltip=tooltip).add_to(m)
-        except:
-            continue
+        popup = f"{row.get('TreeID', '')} - {row.get('TreeName', '')} ({row.get('SPECIES_NAME', '')})"
+        tooltip = row.get("FOREST_RESERVE_NAME", "")
+        folium.Marker(location=[row["MapLat"], row["MapLon"]], popup=popup, tooltip=tooltip).add_to(m)
     st_folium(m, width=700, height=500)
 else:
     st.info("No valid GPS data available to display on map.")